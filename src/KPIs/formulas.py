@@ -5,13 +5,41 @@ This module safely parses and executes formula strings from kpis.yaml.
 Supports basic operations: sum, count, avg, min, max, and arithmetic.
 """
 
+import ast
+import functools
+import numpy as np
 import pandas as pd
 import re
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 import logging
+from src.data.ingestion import distinct_count
+
+try:
+    import numexpr
+except ImportError:  # optional speed-up, DataFrame.eval is used without it
+    numexpr = None
 
 logger = logging.getLogger(__name__)
 
+# "count(distinct InvoiceNo)" is not valid Python, so it is rewritten to
+# "count(distinct(InvoiceNo))" before parsing
+_DISTINCT_PATTERN = re.compile(r'\bdistinct\s+(\w+)', re.IGNORECASE)
+
+# canonical reducer names after aliasing
+_FUNCTION_ALIASES = {'mean': 'avg', 'nunique': 'distinct'}
+
+# pandas Series method used for each reducer
+_REDUCERS = {
+    'sum': 'sum',
+    'count': 'count',
+    'avg': 'mean',
+    'min': 'min',
+    'max': 'max',
+    'distinct': 'nunique',
+}
+
+_BINARY_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+
 
 class FormulaParser:
     """Parses and executes formula strings safely."""
@@ -24,205 +52,319 @@ class FormulaParser:
     def __init__(self, df: pd.DataFrame):
         """
         Initialise parser with a DataFrame.
-
+        
+        The DataFrame should not be modified while the parser is in use,
+        since column arrays are cached after first use.
         """
         self.df = df
+        self._cols: Dict[str, np.ndarray] = {}  # float64 column arrays, filled lazily
     
     def parse_and_execute(self, formula: str) -> float:
         """
         Parse and execute a formula string.
         
         """
-        formula = formula.strip()
-        logger.debug(f"Parsing formula: {formula}")
-        
-        if self._is_aggregate_function(formula):
-            return self._execute_aggregate(formula)
-        elif self._is_ratio_formula(formula):
-            return self._execute_ratio(formula)
-        else:
-            raise ValueError(f"Unsupported formula pattern: {formula}")
+        return self.batch([formula])[formula]
     
-    def _is_aggregate_function(self, formula: str) -> bool:
-        """Check if formula is a simple aggregate like sum(...) or count(...)"""
-        pattern = r'^(sum|count|avg|mean|min|max|nunique)\('
-        return bool(re.match(pattern, formula, re.IGNORECASE))
+    def batch(self, formulas: List[str]) -> Dict[str, float]:
+        """
+        Execute several formulas, scanning each column reduction only once.
+        
+        Aggregates shared between formulas (e.g. "count(distinct InvoiceNo)"
+        in both order_count and revenue_per_order) are computed a single
+        time. Numeric reductions run on cached NumPy column arrays; the rest
+        (e.g. count of a string column) are grouped into one df.agg call.
+        
+        Returns:
+            Dict mapping each formula string to its value
+        """
+        plans = {}
+        for formula in formulas:
+            logger.debug(f"Parsing formula: {formula}")
+            plans[formula] = _compile(formula)
+        
+        aggregates = self._compute_aggregates(plans.values())
+        
+        return {
+            formula: self._execute_plan(plan, aggregates)
+            for formula, plan in plans.items()
+        }
     
-    def _is_ratio_formula(self, formula: str) -> bool:
-        """Check if formula is a ratio like metric1 / metric2"""
-        return '/' in formula
+    def _check_columns(self, cols: Tuple[str, ...]) -> None:
+        """Raise if any of the referenced columns is missing from the DataFrame."""
+        if any(c not in self.df.columns for c in cols):
+            raise ValueError(f"Column not found: {' or '.join(cols)}")
     
-    def _execute_aggregate(self, formula: str) -> float:
+    def _compute_aggregates(self, plans) -> Dict[tuple, float]:
         """
-        Execute an aggregate function.
+        Compute every distinct aggregate used by the given plans.
         
-        Examples:
+        Examples of aggregates:
             sum(Quantity * UnitPrice)
             count(distinct InvoiceNo)
             avg(UnitPrice)
+        
+        Returns:
+            Dict mapping each 'agg' plan node to its value
         """
-        match = re.match(r'(\w+)\((.*)\)', formula, re.IGNORECASE)
-        if not match:
-            raise ValueError(f"Invalid aggregate formula: {formula}")
+        column_reducers = {}  # non-numeric column -> pandas reducers, for df.agg
+        array_reducers = {}  # (cols, expr) -> reducers over a float64 array
+        distinct_cols = set()
         
-        func_name = match.group(1).lower()
-        args = match.group(2).strip()
+        for node in dict.fromkeys(n for plan in plans for n in _aggregate_nodes(plan)):
+            _, func_name, cols, expr = node
+            self._check_columns(cols)
+            
+            if func_name == 'distinct':
+                distinct_cols.add(cols[0])
+            elif expr is None and not pd.api.types.is_numeric_dtype(self.df[cols[0]]):
+                column_reducers.setdefault(cols[0], []).append(_REDUCERS[func_name])
+            else:
+                array_reducers.setdefault((cols, expr), []).append(_REDUCERS[func_name])
         
-        if func_name not in self.ALLOWED_FUNCTIONS:
-            raise ValueError(f"Function '{func_name}' not allowed. Use one of: {self.ALLOWED_FUNCTIONS}")
+        results = {}
         
-        if 'distinct' in args.lower():
-            return self._execute_distinct_count(args)
-        if func_name == 'sum':
-            return self._execute_sum(args)
-        elif func_name in ['count', 'nunique']:
-            return self._execute_count(args)
-        elif func_name in ['avg', 'mean']:
-            return self._execute_avg(args)
-        elif func_name == 'min':
-            return self._execute_min(args)
-        elif func_name == 'max':
-            return self._execute_max(args)
-        else:
-            raise ValueError(f"Unsupported function: {func_name}")
+        if column_reducers:
+            table = self.df.agg(column_reducers)
+            for col, reducers in column_reducers.items():
+                for reducer in reducers:
+                    results[((col,), None, reducer)] = float(table.at[reducer, col])
+        
+        # each column / row-wise expression is evaluated once for all its reducers
+        for (cols, expr), reducers in array_reducers.items():
+            values = self._evaluate_rowwise(cols, expr)
+            for reducer in reducers:
+                results[(cols, expr, reducer)] = _reduce_array(values, reducer)
+        
+        for col in distinct_cols:
+            results[((col,), None, 'nunique')] = self._execute_distinct_count((col,))
+        
+        aggregates = {}
+        for plan in plans:
+            for node in _aggregate_nodes(plan):
+                _, func_name, cols, expr = node
+                aggregates[node] = results[(cols, expr, _REDUCERS[func_name])]
+        
+        return aggregates
     
-    def _execute_sum(self, expression: str) -> float:
-        """
-        Execute sum calculation.
+    def _execute_plan(self, plan: tuple, aggregates: Dict[tuple, float]) -> float:
+        """Evaluate a compiled plan (see _compile) to a single number."""
+        kind, func_name, cols, op = plan
         
-        Examples:
-            "Quantity * UnitPrice" -> sum of all transaction values
-            "Quantity" -> sum of all quantities
-        """
-        if '*' in expression:
-            parts = [p.strip() for p in expression.split('*')]
-            if len(parts) != 2:
-                raise ValueError(f"Complex expressions not supported: {expression}")
-            
-            col1, col2 = parts
-            if col1 not in self.df.columns or col2 not in self.df.columns:
-                raise ValueError(f"Column not found: {col1} or {col2}")
-            
-            result = (self.df[col1] * self.df[col2]).sum()
+        if kind == 'agg':
+            return aggregates[plan]
+        elif kind == 'binop':
+            return self._execute_binop(func_name, cols, op, aggregates)
+        elif kind == 'col':
+            # bare column inside arithmetic, e.g. "Quantity / 2"
+            if cols[0] not in self.df.columns:
+                raise ValueError(f"Cannot evaluate expression: {cols[0]}")
+            return float(self.df[cols[0]].sum())
         else:
-            # Simple sum: "Quantity"
-            col = expression.strip()
-            if col not in self.df.columns:
-                raise ValueError(f"Column not found: {col}")
-            
-            result = self.df[col].sum()
-        
-        return float(result)
+            return float(op)
     
-    def _execute_count(self, expression: str) -> float:
+    def _execute_distinct_count(self, cols: Tuple[str, ...]) -> float:
         """
-        Execute count calculation.
+        Count distinct non-null values of a single column.
         
-        Examples:
-            "InvoiceNo" -> count of all rows
-            "distinct InvoiceNo" -> count of unique invoices
+        Categorical columns are counted from their integer codes (see
+        distinct_count), so unused categories are not counted.
         """
-        if 'distinct' in expression.lower():
-            return self._execute_distinct_count(expression)
-        
-        col = expression.strip()
-        if col not in self.df.columns:
-            raise ValueError(f"Column not found: {col}")
-        
-        return float(self.df[col].count())
-    
-    def _execute_distinct_count(self, expression: str) -> float:
-
-        col = re.sub(r'distinct\s+', '', expression, flags=re.IGNORECASE).strip()
-    
-        if col not in self.df.columns:
-            raise ValueError(f"Column not found: {col}")
-    
-        return float(self.df[col].nunique())
+        self._check_columns(cols)
+        return float(distinct_count(self.df[cols[0]]))
     
-    def _execute_avg(self, expression: str) -> float:
+    def _evaluate_rowwise(self, cols: Tuple[str, ...], expr: str) -> np.ndarray:
         """
-        Execute average calculation.
+        Evaluate the argument of an aggregate to a float64 value per row.
         
+        A bare column is its cached array. Arithmetic is evaluated with
+        numexpr straight on the cached arrays when it is installed,
+        otherwise with DataFrame.eval.
         """
-        if '*' in expression:
-            parts = [p.strip() for p in expression.split('*')]
-            if len(parts) != 2:
-                raise ValueError(f"Complex expressions not supported: {expression}")
-            
-            col1, col2 = parts
-            if col1 not in self.df.columns or col2 not in self.df.columns:
-                raise ValueError(f"Column not found: {col1} or {col2}")
-            
-            result = (self.df[col1] * self.df[col2]).mean()
-        else:
-            col = expression.strip()
-            if col not in self.df.columns:
-                raise ValueError(f"Column not found: {col}")
-            
-            result = self.df[col].mean()
+        self._check_columns(cols)
         
-        return float(result)
-    
-    def _execute_min(self, expression: str) -> float:
-        """Execute minimum calculation."""
-        col = expression.strip()
-        if col not in self.df.columns:
-            raise ValueError(f"Column not found: {col}")
+        if expr is None:
+            return self._column_array(cols[0])
         
-        return float(self.df[col].min())
+        if numexpr is not None:
+            local_dict = {c: self._column_array(c) for c in cols}
+            return numexpr.evaluate(expr, local_dict=local_dict)
+        
+        return self.df.eval(expr).to_numpy(dtype=np.float64, na_value=np.nan)
     
-    def _execute_max(self, expression: str) -> float:
-        """Execute maximum calculation."""
-        col = expression.strip()
-        if col not in self.df.columns:
-            raise ValueError(f"Column not found: {col}")
+    def _column_array(self, col: str) -> np.ndarray:
+        """
+        Column as a float64 NumPy array (nulls as NaN), extracted once.
         
-        return float(self.df[col].max())
+        Later evaluations skip the DataFrame lookup and Series construction.
+        """
+        if col not in self._cols:
+            self._cols[col] = self.df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        return self._cols[col]
     
-    def _execute_ratio(self, formula: str) -> float:
+    def _execute_binop(
+        self,
+        operator: str,
+        operands: Tuple[tuple, tuple],
+        formula: str,
+        aggregates: Dict[tuple, float]
+    ) -> float:
         """
-        Execute ratio calculation (metric1 / metric2).
+        Combine two scalar results, e.g. a ratio of two aggregates.
         
         This is used for derived metrics like:
-            "total_revenue / order_count" (revenue per order)
+            "sum(Quantity) / count(distinct InvoiceNo)" (items per order)
         
-        Note: For now, this requires the numerator and denominator
-        to be other formulas or column names.
+        Note: names of other KPIs (e.g. "total_revenue / order_count")
+        are not resolved yet - Week 4 will handle cross-KPI dependencies.
         """
-        parts = formula.split('/')
-        if len(parts) != 2:
-            raise ValueError(f"Invalid ratio formula: {formula}")
-        
-        numerator = parts[0].strip()
-        denominator = parts[1].strip()
+        left, right = (self._execute_plan(p, aggregates) for p in operands)
         
-        # this is simplified - Week 4 will handle cross-KPI dependencies
-        num_value = self._evaluate_simple_expression(numerator)
-        den_value = self._evaluate_simple_expression(denominator)
+        if operator == '+':
+            return left + right
+        elif operator == '-':
+            return left - right
+        elif operator == '*':
+            return left * right
         
-        if den_value == 0:
+        if right == 0:
             logger.warning(f"Division by zero in formula: {formula}")
             return 0.0
         
-        return float(num_value / den_value)
+        return float(left / right)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(formula: str) -> tuple:
+    """
+    Parse a formula string into a reusable plan.
     
-    def _evaluate_simple_expression(self, expr: str) -> float:
-        """
-        Evaluate a simple expression (column name or aggregate).
-        
-        Used for ratio calculations.
-        """
-        if self._is_aggregate_function(expr):
-            return self._execute_aggregate(expr)
-        elif expr in self.df.columns:
-            return float(self.df[expr].sum())
-        else:
-            # try to parse as a number
-            try:
-                return float(expr)
-            except ValueError:
-                raise ValueError(f"Cannot evaluate expression: {expr}")
+    Plans are nested (kind, func_name, cols, op) tuples:
+        ('agg', reducer, columns, row_expr)  - row_expr is None for a bare column
+        ('binop', operator, (left, right), source)
+        ('col', None, (name,), None)
+        ('const', None, (), value)
+    
+    The top level is always 'agg' or 'binop'; both halves of a ratio live
+    in the same tree, so neither is re-parsed when the ratio is evaluated.
+    Plans only depend on the formula text, so they are cached and shared by
+    every FormulaParser; column checks happen at execution time.
+    """
+    source = _DISTINCT_PATTERN.sub(r'distinct(\1)', formula.strip())
+    
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError:
+        raise ValueError(f"Unsupported formula pattern: {formula}")
+    
+    # whitelist check over the whole tree before building anything
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = node.func.id.lower() if isinstance(node.func, ast.Name) else None
+            if name not in FormulaParser.ALLOWED_FUNCTIONS:
+                raise ValueError(
+                    f"Function '{name or ast.unparse(node.func)}' not allowed. "
+                    f"Use one of: {FormulaParser.ALLOWED_FUNCTIONS}"
+                )
+    
+    plan = _compile_scalar(tree.body, formula)
+    
+    # a bare column or number is only meaningful inside arithmetic
+    if plan[0] not in ('agg', 'binop'):
+        raise ValueError(f"Unsupported formula pattern: {formula.strip()}")
+    
+    return plan
+
+
+def _reduce_array(values: np.ndarray, reducer: str) -> float:
+    """
+    Apply a pandas-named reducer to a float64 array, skipping NaN like pandas.
+    
+    An empty (or all-NaN) input gives 0 for sum/count and NaN otherwise.
+    """
+    valid = ~np.isnan(values)
+    n_valid = int(np.count_nonzero(valid))
+    
+    if reducer == 'count':
+        return float(n_valid)
+    if n_valid == 0:
+        return 0.0 if reducer == 'sum' else float('nan')
+    if n_valid < len(values):
+        values = values[valid]
+    
+    return float(getattr(values, reducer)())
+
+
+def _aggregate_nodes(plan: tuple):
+    """Yield the 'agg' nodes of a compiled plan."""
+    if plan[0] == 'agg':
+        yield plan
+    elif plan[0] == 'binop':
+        for operand in plan[2]:
+            yield from _aggregate_nodes(operand)
+
+
+def _compile_scalar(node: ast.AST, formula: str) -> tuple:
+    """Compile a node that evaluates to a single number."""
+    if isinstance(node, ast.Call):
+        return _compile_aggregate(node, formula)
+    
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        operands = (_compile_scalar(node.left, formula), _compile_scalar(node.right, formula))
+        return ('binop', _BINARY_OPERATORS[type(node.op)], operands, ast.unparse(node))
+    
+    if isinstance(node, ast.Name):
+        return ('col', None, (node.id,), None)
+    
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return ('const', None, (), node.value)
+    
+    raise ValueError(f"Unsupported formula pattern: {formula}")
+
+
+def _compile_aggregate(node: ast.Call, formula: str) -> tuple:
+    """Compile an aggregate such as sum(Quantity * UnitPrice) into a plan."""
+    func_name = node.func.id.lower()
+    func_name = _FUNCTION_ALIASES.get(func_name, func_name)
+    
+    if len(node.args) != 1 or node.keywords:
+        raise ValueError(f"Invalid aggregate formula: {formula}")
+    arg = node.args[0]
+    
+    # count(distinct(X)) is a distinct count of X
+    if (
+        func_name == 'count'
+        and isinstance(arg, ast.Call)
+        and arg.func.id.lower() == 'distinct'
+    ):
+        return _compile_aggregate(arg, formula)
+    
+    if isinstance(arg, ast.Name):
+        return ('agg', func_name, (arg.id,), None)
+    
+    if func_name == 'distinct':
+        raise ValueError(f"Distinct count needs a single column: {formula}")
+    
+    cols = tuple(dict.fromkeys(_rowwise_columns(arg, formula)))
+    if not cols:
+        raise ValueError(f"Aggregate needs at least one column: {formula}")
+    
+    return ('agg', func_name, cols, ast.unparse(arg))
+
+
+def _rowwise_columns(node: ast.AST, formula: str):
+    """Yield the columns used by a row-wise expression, rejecting anything else."""
+    if isinstance(node, ast.Name):
+        yield node.id
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        yield from _rowwise_columns(node.left, formula)
+        yield from _rowwise_columns(node.right, formula)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        yield from _rowwise_columns(node.operand, formula)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return
+    else:
+        raise ValueError(f"Complex expressions not supported: {ast.unparse(node)} in {formula}")
 
 
 def calculate_kpi_value(df: pd.DataFrame, formula: str) -> float:
@@ -5,15 +5,23 @@ This module handles reading CSV files and performing initial data type conversio
 Validation happens in a separate module to keep concerns separated.
 """
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 import logging
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Low-cardinality identifier columns stored as pandas categoricals so distinct
+# counts work on their integer codes instead of hashing every row.
+# Description is left as a plain string column (too many distinct values).
+CATEGORICAL_COLUMNS = ('InvoiceNo', 'StockCode', 'CustomerID', 'Country')
+
 
 class DataLoader:
     """Loads retail transaction data from CSV files."""
@@ -40,36 +48,118 @@ class DataLoader:
         logger.info(f"Loading data from {filepath}")
         
         try:
-            df = pd.read_csv(
-                filepath,
-                encoding='latin-1',  #to deal with special characters 
-                parse_dates=['InvoiceDate'],  
-                dtype={
-                    'InvoiceNo': str,
-                    'StockCode': str,
-                    'Description': str,
-                    'CustomerID': str,  # keep as string to preserve format
-                    'Country': str
-                }
-            )
+            # pyarrow parses in parallel and keeps strings in Arrow buffers
+            # rather than one Python object per cell
+            df = self._to_frame(pv.read_csv(filepath, **self._csv_options()))
             
             logger.info(f"Loaded {len(df):,} rows and {len(df.columns)} columns")
             logger.info(f"Date range: {df['InvoiceDate'].min()} to {df['InvoiceDate'].max()}")
             
             return df
             
-        except pd.errors.EmptyDataError:
-            logger.error(f"File is empty: {filepath}")
+        except pa.ArrowInvalid as e:
+            logger.error(f"File is empty or malformed: {filepath} ({e})")
             raise
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             raise
     
-    def get_data_summary(self, df: pd.DataFrame) -> dict:
+    def iter_chunks(
+        self,
+        filename: str = "UK retail data.csv",
+        chunksize: int = 200_000
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Stream the CSV as DataFrames of at most ``chunksize`` rows.
+        
+        Chunks have the same dtypes as load_retail_data, but only one chunk
+        is held in memory at a time. Categoricals are built per chunk.
+        """
+        if chunksize <= 0:
+            raise ValueError(f"chunksize must be positive, got {chunksize}")
+        
+        filepath = self.data_dir / filename
+        
+        if not filepath.exists():
+            raise FileNotFoundError(f"Data file not found: {filepath}")
+        
+        logger.info(f"Streaming data from {filepath} in chunks of {chunksize:,} rows")
+        
+        reader = pv.open_csv(filepath, **self._csv_options())
+        pending, pending_rows = [], 0
+        yielded = False
+        
+        # regroup pyarrow's byte-sized record batches into row-sized chunks
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            
+            while pending_rows >= chunksize:
+                table = pa.Table.from_batches(pending, schema=reader.schema)
+                yield self._to_frame(table.slice(0, chunksize))
+                yielded = True
+                
+                rest = table.slice(chunksize)
+                pending, pending_rows = rest.to_batches(), rest.num_rows
+        
+        # a header-only file still yields one empty, correctly typed chunk
+        if pending_rows or not yielded:
+            yield self._to_frame(pa.Table.from_batches(pending, schema=reader.schema))
+    
+    def _csv_options(self, encoding: str = 'latin-1') -> dict:
+        """
+        pyarrow CSV options shared by full and streaming reads.
+        
+        Dates are parsed by Arrow's vectorised timestamp parser, so there is
+        no per-row strptime as with pandas' parse_dates.
+        """
+        return {
+            'read_options': pv.ReadOptions(
+                encoding=encoding,  # latin-1 for the raw file's special characters
+                block_size=1 << 20
+            ),
+            'convert_options': pv.ConvertOptions(
+                column_types={
+                    'InvoiceNo': pa.string(),
+                    'StockCode': pa.string(),
+                    'Description': pa.string(),
+                    'CustomerID': pa.string(),  # keep as string to preserve format
+                    'Country': pa.string(),
+                    'InvoiceDate': pa.timestamp('ns'),
+                    # pinned so streaming reads don't infer int64 for
+                    # UnitPrice from a first block of whole-number prices
+                    'Quantity': pa.int64(),
+                    'UnitPrice': pa.float64()
+                },
+                # raw file uses month-first "12/1/2010 8:26"; ISO 8601 covers
+                # CSVs written back out by save_processed_data
+                timestamp_parsers=['%m/%d/%Y %H:%M', pv.ISO8601],
+                strings_can_be_null=True  # empty cells are missing, not ''
+            ),
+        }
+    
+    def _to_frame(self, table: pa.Table) -> pd.DataFrame:
+        """Convert a parsed Arrow table to the loader's pandas dtypes."""
+        df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        
+        return df
+    
+    def get_data_summary(self, df: pd.DataFrame, deep: bool = False) -> dict:
         """
         Get basic summary statistics about the loaded data.
         
+        Args:
+            df: DataFrame to summarise
+            deep: Measure memory of object (Python string) columns exactly.
+                This walks every string and is slow on large frames;
+                the default shallow figure undercounts object columns.
         """
+        null_counts = df.isna().sum()
+        
         summary = {
             'total_rows': len(df),
             'total_columns': len(df.columns),
@@ -77,12 +167,12 @@ class DataLoader:
                 'start': df['InvoiceDate'].min(),
                 'end': df['InvoiceDate'].max()
             },
-            'unique_invoices': df['InvoiceNo'].nunique(),
-            'unique_customers': df['CustomerID'].nunique(),
-            'unique_products': df['StockCode'].nunique(),
-            'unique_countries': df['Country'].nunique(),
-            'missing_values': df.isnull().sum().to_dict(),
-            'memory_usage_mb': df.memory_usage(deep=True).sum() / 1024**2
+            'unique_invoices': distinct_count(df['InvoiceNo']),
+            'unique_customers': distinct_count(df['CustomerID']),
+            'unique_products': distinct_count(df['StockCode']),
+            'unique_countries': distinct_count(df['Country']),
+            'missing_values': null_counts.to_dict(),
+            'memory_usage_mb': df.memory_usage(deep=deep).sum() / 1024**2
         }
         
         return summary
@@ -94,11 +184,15 @@ class DataLoader:
         output_dir: str = "data/processed"
     ) -> None:
         """
-        Save processed data to CSV.
+        Save processed data, as Parquet by default.
+        
+        Parquet keeps dtypes (dates, categoricals) so nothing has to be
+        re-parsed on load. Filenames ending in ``.csv`` still write CSV.
         
         Args:
             df: DataFrame to save
-            filename: Output filename
+            filename: Output filename (suffix is replaced with .parquet
+                unless it is .csv)
             output_dir: Directory to save to
         """
         output_path = Path(output_dir)
@@ -106,9 +200,70 @@ class DataLoader:
         
         filepath = output_path / filename
         
-        logger.info(f"Saving processed data to {filepath}")
-        df.to_csv(filepath, index=False)
+        if filename.endswith('.csv'):
+            logger.info(f"Saving processed data to {filepath}")
+            df.to_csv(filepath, index=False)
+        else:
+            filepath = filepath.with_suffix('.parquet')
+            logger.info(f"Saving processed data to {filepath}")
+            df.to_parquet(filepath, engine='pyarrow', compression='zstd', index=False)
+        
         logger.info(f"Saved {len(df):,} rows")
+    
+    def load_processed_data(
+        self,
+        filename: str,
+        input_dir: str = "data/processed"
+    ) -> pd.DataFrame:
+        """
+        Load data written by save_processed_data.
+        
+        Args:
+            filename: Name used when saving (.csv files are read as CSV,
+                anything else from the matching .parquet file)
+            input_dir: Directory to load from
+            
+        Returns:
+            DataFrame of the saved rows. From Parquet, Quantity, UnitPrice
+            and InvoiceDate keep their Arrow dtypes and the identifier
+            columns stay categorical with every saved category, including
+            ones no row uses any more; Description and the category labels
+            come back as pandas' StringDtype rather than ArrowDtype. From
+            CSV, the loader's column types are re-applied and categories
+            are rebuilt from the rows.
+        """
+        filepath = Path(input_dir) / filename
+        if not filename.endswith('.csv'):
+            filepath = filepath.with_suffix('.parquet')
+        
+        if not filepath.exists():
+            raise FileNotFoundError(f"Processed data file not found: {filepath}")
+        
+        logger.info(f"Loading processed data from {filepath}")
+        
+        if filepath.suffix == '.csv':
+            # to_csv writes UTF-8
+            df = self._to_frame(pv.read_csv(filepath, **self._csv_options(encoding='utf-8')))
+        else:
+            df = pd.read_parquet(filepath, engine='pyarrow')
+        
+        logger.info(f"Loaded {len(df):,} rows")
+        return df
+
+
+def distinct_count(series: pd.Series) -> int:
+    """
+    Count distinct non-null values of a column.
+    
+    Categorical columns are counted from their integer codes, which needs no
+    string hashing and stays correct once the frame has been filtered or
+    reloaded from Parquet (unused categories are not counted).
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        seen = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        return int(np.count_nonzero(seen))
+    return int(series.nunique())
 
 
 def load_data(filename: str = "UK retail data.csv") -> pd.DataFrame:
@@ -133,7 +288,7 @@ if __name__ == "__main__":
     df = loader.load_retail_data()
     print("DATA LOADING SUMMARY")
     
-    summary = loader.get_data_summary(df)
+    summary = loader.get_data_summary(df, deep=True)
     
     print(f"\nTotal rows: {summary['total_rows']:,}")
     print(f"Total columns: {summary['total_columns']}")
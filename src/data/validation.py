@@ -5,15 +5,45 @@ This module validates data against the rules defined in config/data_contracts.ya
 and generates quality reports.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import functools
+import numpy as np
 import pandas as pd
 import yaml
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 from src.data.ingestion import DataLoader  
 
+try:
+    from yaml import CSafeLoader as _YamlLoader  # libyaml, much faster
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader
+
+try:
+    import numexpr
+except ImportError:  # optional speed-up, plain numpy is used without it
+    numexpr = None
+
+try:
+    from numba import njit
+except ImportError:  # optional speed-up, plain numpy is used without it
+    njit = None
+
 logger = logging.getLogger(__name__)
 
+MAX_TRANSACTION_VALUE = 100000
+
+# dtype.kind codes accepted for each contract type. 'O' covers object and
+# pd.StringDtype, 'U' is what pd.ArrowDtype reports for Arrow strings.
+EXPECTED_DTYPE_KINDS = {
+    "string": {"O", "U"},
+    "integer": {"i", "u"},
+    "float": {"f"},
+    "datetime": {"M"},
+}
+
 
 class DataValidator:
     """Validates data against defined contracts and quality rules."""
@@ -25,14 +55,17 @@ class DataValidator:
         """
         self.contracts_path = Path(contracts_path)
         self.contracts = self._load_contracts()
+        self._stream = None  # running counters filled by update()
     
     def _load_contracts(self) -> dict:
         """Load data contracts from YAML file."""
         if not self.contracts_path.exists():
             raise FileNotFoundError(f"Contracts file not found: {self.contracts_path}")
         
-        with open(self.contracts_path, "r") as f:
-            contracts = yaml.safe_load(f)
+        # the parse is shared; each validator gets its own copy to modify
+        contracts = copy.deepcopy(_load_contracts_cached(
+            str(self.contracts_path), self.contracts_path.stat().st_mtime
+        ))
         
         logger.info(f"Loaded data contracts from {self.contracts_path}")
         return contracts
@@ -69,31 +102,40 @@ class DataValidator:
     
     def _check_dtype(self, actual_dtype, expected_type: str) -> bool:
         """Check if actual dtype matches expected type."""
-        dtype_str = str(actual_dtype).lower()
-        
-        if expected_type == "string":
-            return dtype_str == "object"
-        elif expected_type == "integer":
-            return "int" in dtype_str
-        elif expected_type == "float":
-            return "float" in dtype_str
-        elif expected_type == "datetime":
-            return "datetime" in dtype_str
-        else:
+        if isinstance(actual_dtype, pd.CategoricalDtype):
+            actual_dtype = actual_dtype.categories.dtype
+        
+        kinds = EXPECTED_DTYPE_KINDS.get(expected_type)
+        if kinds is None:
             return True
+        
+        # numpy, pandas extension and Arrow-backed dtypes all expose .kind
+        return actual_dtype.kind in kinds
     
     def check_completeness(self, df: pd.DataFrame) -> Dict[str, dict]:
         """Check data completeness against thresholds."""
+        return self._completeness_results(self._count_nulls(df), len(df))
+    
+    def _count_nulls(self, df: pd.DataFrame) -> Dict[str, int]:
+        """Null counts for the columns that have completeness rules."""
+        quality_rules = self.contracts["data_quality"]["completeness"]
+        
+        # one vectorised pass over just the checked columns
+        checked_cols = [col for col in quality_rules if col in df.columns]
+        null_counts = df[checked_cols].isna().sum()
+        
+        return {col: int(null_counts[col]) for col in checked_cols}
+    
+    def _completeness_results(
+        self, null_counts: Dict[str, int], total_rows: int
+    ) -> Dict[str, dict]:
         results = {}
         quality_rules = self.contracts["data_quality"]["completeness"]
         
-        for col, rules in quality_rules.items():
-            if col not in df.columns:
-                continue
-            
-            missing_count = df[col].isnull().sum()
-            missing_pct = missing_count / len(df)
-            threshold = rules["missing_threshold"]
+        for col, missing_count in null_counts.items():
+            # undefined (NaN, so the check fails) on an empty frame
+            missing_pct = missing_count / total_rows if total_rows else np.nan
+            threshold = quality_rules[col]["missing_threshold"]
             
             results[col] = {
                 "missing_count": int(missing_count),
@@ -107,91 +149,187 @@ class DataValidator:
     
     def check_value_ranges(self, df: pd.DataFrame) -> Dict[str, dict]:
         """Check if numeric values are within expected ranges."""
-        results = {}
+        return self._range_results(self._count_range_violations(df), len(df))
+    
+    def _range_rules(self) -> Dict[str, Tuple]:
+        """(min_value, max_value) for every schema column with a range rule."""
         schema = self.contracts["raw_data"]["schema"]
+        bounds = {}
         
         for col, rules in schema.items():
+            validation = rules.get("validation", {})
+            if "min_value" in validation or "max_value" in validation:
+                bounds[col] = (validation.get("min_value"), validation.get("max_value"))
+        
+        return bounds
+    
+    def _count_range_violations(self, df: pd.DataFrame) -> Dict[str, Tuple]:
+        """(below, above, actual_min, actual_max) per range-checked column."""
+        counts = {}
+        
+        for col, (min_val, max_val) in self._range_rules().items():
             if col not in df.columns:
                 continue
             
-            validation = rules.get("validation", {})
-            if "min_value" in validation or "max_value" in validation:
-                min_val = validation.get("min_value")
-                max_val = validation.get("max_value")
-                
-                violations = 0
-                if min_val is not None:
-                    violations += (df[col] < min_val).sum()
-                if max_val is not None:
-                    violations += (df[col] > max_val).sum()
-                
-                results[col] = {
-                    "violations": int(violations),
-                    "violation_percentage": float(violations / len(df)),
-                    "min_value": min_val,
-                    "max_value": max_val,
-                    "actual_min": float(df[col].min())
-                    if pd.api.types.is_numeric_dtype(df[col])
-                    else None,
-                    "actual_max": float(df[col].max())
-                    if pd.api.types.is_numeric_dtype(df[col])
-                    else None,
-                    "passes": violations == 0,
-                }
+            if pd.api.types.is_numeric_dtype(df[col]):
+                below, above, actual_min, actual_max = _range_scan(
+                    _to_float_array(df[col]),
+                    -np.inf if min_val is None else float(min_val),
+                    np.inf if max_val is None else float(max_val),
+                )
+                counts[col] = (int(below), int(above), float(actual_min), float(actual_max))
+            else:
+                below = (df[col] < min_val).sum() if min_val is not None else 0
+                above = (df[col] > max_val).sum() if max_val is not None else 0
+                counts[col] = (int(below), int(above), None, None)
+        
+        return counts
+    
+    def _range_results(self, counts: Dict[str, Tuple], total_rows: int) -> Dict[str, dict]:
+        results = {}
+        bounds = self._range_rules()
+        
+        for col, (below, above, actual_min, actual_max) in counts.items():
+            min_val, max_val = bounds[col]
+            violations = below + above
+            violation_pct = violations / total_rows if total_rows else np.nan
+            
+            results[col] = {
+                "violations": int(violations),
+                "violation_percentage": float(violation_pct),
+                "min_value": min_val,
+                "max_value": max_val,
+                "actual_min": actual_min,
+                "actual_max": actual_max,
+                "passes": violations == 0,
+            }
         
         return results
     
     def check_consistency(self, df: pd.DataFrame) -> Dict[str, dict]:
-        """Check business logic consistency rules."""
-        results = {}
+        """
+        Check business logic consistency rules.
+        
+        Works on the raw column arrays and never modifies ``df``.
+        """
+        return self._consistency_results(self._count_consistency_violations(df))
+    
+    def _count_consistency_violations(self, df: pd.DataFrame) -> Dict[str, Tuple[int, int]]:
+        """(violations, total_checked) per implemented consistency rule."""
+        counts = {}
         rules = self.contracts["data_quality"]["consistency"]["rules"]
         
+        qty = _to_float_array(df["Quantity"])
+        price = _to_float_array(df["UnitPrice"])
+        
         for rule in rules:
             name = rule["name"]
-            description = rule["description"]
             
             if name == "cancellation_quantity_match":
-                cancellations = df[df["InvoiceNo"].str.startswith("C", na=False)]
-                violations = (cancellations["Quantity"] > 0).sum()
-                
-                results[name] = {
-                    "description": description,
-                    "violations": int(violations),
-                    "total_checked": len(cancellations),
-                    "passes": violations == 0,
-                }
+                is_cancellation = _starts_with(df["InvoiceNo"], "C")
+                violations = np.count_nonzero(is_cancellation & (qty > 0))
+                counts[name] = (int(violations), int(np.count_nonzero(is_cancellation)))
             
             elif name == "positive_price":
-                violations = (df["UnitPrice"] < 0).sum()
-                
-                results[name] = {
-                    "description": description,
-                    "violations": int(violations),
-                    "total_checked": len(df),
-                    "passes": violations == 0,
-                }
+                violations = np.count_nonzero(price < 0)
+                counts[name] = (int(violations), len(df))
             
             elif name == "valid_transaction_value":
-                df["TransactionValue"] = df["Quantity"] * df["UnitPrice"]
-                violations = (df["TransactionValue"].abs() > 100000).sum()
-                
-                results[name] = {
-                    "description": description,
-                    "violations": int(violations),
-                    "total_checked": len(df),
-                    "passes": violations == 0,
-                }
+                violations = np.count_nonzero(_exceeds_transaction_limit(qty, price))
+                counts[name] = (int(violations), len(df))
+        
+        return counts
+    
+    def _consistency_results(self, counts: Dict[str, Tuple[int, int]]) -> Dict[str, dict]:
+        results = {}
+        rules = self.contracts["data_quality"]["consistency"]["rules"]
+        
+        for rule in rules:
+            name = rule["name"]
+            if name not in counts:
+                continue
+            
+            violations, total_checked = counts[name]
+            results[name] = {
+                "description": rule["description"],
+                "violations": violations,
+                "total_checked": total_checked,
+                "passes": violations == 0,
+            }
         
         return results
     
-    def generate_quality_report(self, df: pd.DataFrame) -> dict:
-        """Generate comprehensive data quality report."""
+    def update(self, chunk: pd.DataFrame) -> None:
+        """
+        Fold one chunk of data into the running quality counters.
+        
+        Feed chunks from DataLoader.iter_chunks, then call
+        generate_quality_report() without a DataFrame to finalise. Only
+        counters are kept, so the full data never has to be in memory.
+        The schema is checked on the first chunk.
+        """
+        if self._stream is None:
+            self._stream = {
+                "rows": 0,
+                "schema": self.validate_schema(chunk),
+                "nulls": {},
+                "ranges": {},
+                "consistency": {},
+            }
+        state = self._stream
+        state["rows"] += len(chunk)
+        
+        for col, count in self._count_nulls(chunk).items():
+            state["nulls"][col] = state["nulls"].get(col, 0) + count
+        
+        for col, (below, above, lo, hi) in self._count_range_violations(chunk).items():
+            if col in state["ranges"]:
+                prev_below, prev_above, prev_lo, prev_hi = state["ranges"][col]
+                below += prev_below
+                above += prev_above
+                if lo is not None:
+                    # fmin/fmax ignore NaN from all-null chunks
+                    lo, hi = float(np.fmin(prev_lo, lo)), float(np.fmax(prev_hi, hi))
+            state["ranges"][col] = (below, above, lo, hi)
+        
+        for name, (violations, checked) in self._count_consistency_violations(chunk).items():
+            prev_violations, prev_checked = state["consistency"].get(name, (0, 0))
+            state["consistency"][name] = (prev_violations + violations, prev_checked + checked)
+    
+    def reset(self) -> None:
+        """Discard counters accumulated by update()."""
+        self._stream = None
+    
+    def generate_quality_report(self, df: Optional[pd.DataFrame] = None) -> dict:
+        """
+        Generate comprehensive data quality report.
+        
+        With a DataFrame the checks run on it directly; without one the
+        report is finalised from the chunks passed to update().
+        """
         logger.info("Generating data quality report...")
         
-        schema_valid, schema_errors = self.validate_schema(df)
-        completeness = self.check_completeness(df)
-        ranges = self.check_value_ranges(df)
-        consistency = self.check_consistency(df)
+        if df is not None:
+            schema_valid, schema_errors = self.validate_schema(df)
+            
+            # the checks only read df and spend most of their time in
+            # GIL-releasing NumPy/Arrow/numba kernels, so they can overlap
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                completeness_future = executor.submit(self.check_completeness, df)
+                ranges_future = executor.submit(self.check_value_ranges, df)
+                consistency_future = executor.submit(self.check_consistency, df)
+            
+            completeness = completeness_future.result()
+            ranges = ranges_future.result()
+            consistency = consistency_future.result()
+        elif self._stream is not None:
+            state = self._stream
+            schema_valid, schema_errors = state["schema"]
+            completeness = self._completeness_results(state["nulls"], state["rows"])
+            ranges = self._range_results(state["ranges"], state["rows"])
+            consistency = self._consistency_results(state["consistency"])
+        else:
+            raise ValueError("No data to report on: pass a DataFrame or call update() first")
         
         total = passed = 0
         
@@ -282,12 +420,96 @@ class DataValidator:
         print("\n" + "=" * 60)
 
 
+@functools.lru_cache(maxsize=8)
+def _load_contracts_cached(path: str, mtime: float) -> dict:
+    """
+    Parse a contracts file once per (path, modification time).
+    
+    Callers must copy the result before handing it out, since the cached
+    dict is shared; editing the file changes mtime and re-parses.
+    """
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+
+def _to_float_array(series: pd.Series) -> np.ndarray:
+    """Return a column as a float64 NumPy array with nulls as NaN."""
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _range_scan(arr, lo, hi):
+        """
+        Single pass over arr returning (count < lo, count > hi, min, max).
+        
+        NaNs are skipped like pandas does; min/max are NaN if nothing is left.
+        """
+        below = 0
+        above = 0
+        valid = 0
+        amin = np.inf
+        amax = -np.inf
+        for i in range(arr.shape[0]):
+            x = arr[i]
+            if not np.isnan(x):
+                valid += 1
+                if x < lo:
+                    below += 1
+                if x > hi:
+                    above += 1
+                amin = min(amin, x)
+                amax = max(amax, x)
+        if valid == 0:
+            return below, above, np.nan, np.nan
+        return below, above, amin, amax
+else:
+    def _range_scan(arr, lo, hi):
+        """NumPy fallback for the numba kernel: (count < lo, count > hi, min, max)."""
+        below = np.count_nonzero(arr < lo)
+        above = np.count_nonzero(arr > hi)
+        if np.isnan(arr).all():
+            return below, above, np.nan, np.nan
+        return below, above, np.nanmin(arr), np.nanmax(arr)
+
+
+def _starts_with(series: pd.Series, prefix: str) -> np.ndarray:
+    """
+    Boolean array of rows whose value starts with ``prefix`` (nulls are False).
+    
+    For categoricals the prefix test runs once per category and is gathered
+    back to rows through the integer codes, so row strings are never touched.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        per_category = np.asarray(series.cat.categories.str.startswith(prefix), dtype=bool)
+        # trailing False is picked up by the -1 code of null rows
+        return np.append(per_category, False)[series.cat.codes.to_numpy()]
+    
+    return series.str.startswith(prefix, na=False).to_numpy(dtype=bool)
+
+
+def _exceeds_transaction_limit(qty: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """Flag rows where abs(Quantity * UnitPrice) exceeds MAX_TRANSACTION_VALUE."""
+    if numexpr is not None:
+        # fuses multiply, abs and compare without full-size temporaries
+        return numexpr.evaluate(
+            "abs(qty * price) > limit",
+            local_dict={"qty": qty, "price": price, "limit": MAX_TRANSACTION_VALUE},
+        )
+    # abs in place so the product is the only full-size float temporary
+    tx = np.multiply(qty, price)
+    np.abs(tx, out=tx)
+    return tx > MAX_TRANSACTION_VALUE
+
+
 def main():
     loader = DataLoader()
-    df = loader.load_retail_data()
-    
     validator = DataValidator()
-    report = validator.generate_quality_report(df)
+    
+    # stream the CSV so only one chunk is in memory at a time
+    for chunk in loader.iter_chunks():
+        validator.update(chunk)
+    report = validator.generate_quality_report()
     validator.print_report(report)
 
 
@@ -0,0 +1,89 @@
+"""Tests for src.KPIs.formulas."""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.KPIs.formulas import FormulaParser
+
+
+def _numpy_frame():
+    return pd.DataFrame({
+        "InvoiceNo": ["536365", "536365", "536366", "C536367"],
+        "Quantity": [6, 2, 4, -1],
+        "UnitPrice": [2.5, 1.0, np.nan, 3.0],
+        "CustomerID": ["17850", "17850", None, "13047"],
+    })
+
+
+def _arrow_frame():
+    return _numpy_frame().convert_dtypes(dtype_backend="pyarrow")
+
+
+def _categorical_frame():
+    return _arrow_frame().astype({"InvoiceNo": "category", "CustomerID": "category"})
+
+
+@pytest.fixture(params=[_numpy_frame, _arrow_frame, _categorical_frame],
+                ids=["numpy", "arrow", "categorical"])
+def parser(request):
+    return FormulaParser(request.param())
+
+
+def test_rejects_functions_outside_whitelist(parser):
+    with pytest.raises(ValueError, match="Function 'eval' not allowed"):
+        parser.parse_and_execute("eval(1)")
+
+
+def test_count_distinct_rewrite(parser):
+    assert parser.parse_and_execute("count(distinct InvoiceNo)") == 3
+    assert parser.parse_and_execute("COUNT(DISTINCT CustomerID)") == 2
+
+
+def test_rowwise_arithmetic_skips_nan(parser):
+    # the NaN price row drops out of the sum, as with pandas
+    assert parser.parse_and_execute("sum(Quantity * UnitPrice)") == pytest.approx(14.0)
+    assert parser.parse_and_execute("avg(UnitPrice)") == pytest.approx(6.5 / 3)
+    assert parser.parse_and_execute("count(UnitPrice)") == 3
+
+
+def test_ratio_of_aggregates(parser):
+    result = parser.parse_and_execute("sum(Quantity) / count(distinct InvoiceNo)")
+    assert result == pytest.approx(11 / 3)
+
+
+def test_division_by_zero_returns_zero(parser, caplog):
+    with caplog.at_level(logging.WARNING):
+        result = parser.parse_and_execute("sum(Quantity) / sum(Quantity - Quantity)")
+    
+    assert result == 0.0
+    assert "Division by zero" in caplog.text
+
+
+def test_distinct_ignores_unused_categories():
+    df = _categorical_frame()
+    filtered = df[df["Quantity"] > 0]
+    
+    # C536367 is still a category but no longer appears in the data
+    assert len(filtered["InvoiceNo"].cat.categories) == 3
+    assert FormulaParser(filtered).parse_and_execute("count(distinct InvoiceNo)") == 2
+
+
+def test_batch_matches_individual_formulas(parser):
+    # sum(Quantity) and count(distinct InvoiceNo) are shared between formulas;
+    # count(InvoiceNo) goes through the non-numeric df.agg path
+    formulas = [
+        "sum(Quantity)",
+        "count(distinct InvoiceNo)",
+        "sum(Quantity) / count(distinct InvoiceNo)",
+        "count(InvoiceNo)",
+        "sum(Quantity * UnitPrice) / count(InvoiceNo)",
+    ]
+    
+    batched = parser.batch(formulas)
+    individual = {f: FormulaParser(parser.df).parse_and_execute(f) for f in formulas}
+    
+    assert batched == individual
+    assert batched["count(InvoiceNo)"] == 4
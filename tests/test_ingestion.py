@@ -0,0 +1,71 @@
+"""Tests for src.data.ingestion."""
+
+import pandas as pd
+import pytest
+
+from src.data.ingestion import DataLoader
+
+
+HEADER = "InvoiceNo,StockCode,Description,Quantity,InvoiceDate,UnitPrice,CustomerID,Country\n"
+
+
+def _write_csv(path, prices):
+    rows = [
+        f"536365,85123A,WHITE HANGING HEART T-LIGHT HOLDER,6,12/1/2010 8:26,{price},17850,United Kingdom\n"
+        for price in prices
+    ]
+    path.write_text(HEADER + "".join(rows), encoding="latin-1")
+
+
+def test_iter_chunks_keeps_float_prices_after_first_block(tmp_path):
+    # whole-number prices fill well past the reader's first 1 MiB block
+    _write_csv(tmp_path / "retail.csv", ["2"] * 30_000 + ["2.55"])
+    loader = DataLoader(data_dir=str(tmp_path))
+    
+    chunks = list(loader.iter_chunks("retail.csv", chunksize=10_000))
+    full = loader.load_retail_data("retail.csv")
+    
+    assert sum(len(c) for c in chunks) == len(full) == 30_001
+    assert all(c["UnitPrice"].dtype == full["UnitPrice"].dtype for c in chunks)
+    assert chunks[-1]["UnitPrice"].iloc[-1] == 2.55
+
+
+def test_iter_chunks_rejects_non_positive_chunksize(tmp_path):
+    _write_csv(tmp_path / "retail.csv", ["2.55"])
+    loader = DataLoader(data_dir=str(tmp_path))
+    
+    with pytest.raises(ValueError, match="chunksize"):
+        next(loader.iter_chunks("retail.csv", chunksize=0))
+
+
+def _round_trip(tmp_path, filename):
+    _write_csv(tmp_path / "retail.csv", ["2.55", "", "3.39"])
+    loader = DataLoader(data_dir=str(tmp_path))
+    df = loader.load_retail_data("retail.csv")
+    # stands in for a country filtered out during processing
+    df["Country"] = df["Country"].cat.add_categories(["France"])
+    
+    loader.save_processed_data(df, filename, output_dir=str(tmp_path / "processed"))
+    return df, loader.load_processed_data(filename, input_dir=str(tmp_path / "processed"))
+
+
+def test_parquet_round_trip_keeps_dtypes(tmp_path):
+    df, loaded = _round_trip(tmp_path, "clean.parquet")
+    
+    assert len(loaded) == len(df) == 3
+    for col in ("Quantity", "UnitPrice", "InvoiceDate"):
+        assert loaded[col].dtype == df[col].dtype, col
+    for col in ("InvoiceNo", "StockCode", "CustomerID", "Country"):
+        assert isinstance(loaded[col].dtype, pd.CategoricalDtype), col
+    assert list(loaded["Country"].cat.categories) == ["United Kingdom", "France"]
+    assert isinstance(loaded["Description"].dtype, pd.StringDtype)
+    assert loaded["UnitPrice"].isna().sum() == 1
+
+
+def test_csv_round_trip_reapplies_loader_dtypes(tmp_path):
+    df, loaded = _round_trip(tmp_path, "clean.csv")
+    
+    assert len(loaded) == len(df) == 3
+    assert loaded.dtypes.drop("Country").to_dict() == df.dtypes.drop("Country").to_dict()
+    assert list(loaded["Country"].cat.categories) == ["United Kingdom"]
+    assert loaded["UnitPrice"].isna().sum() == 1
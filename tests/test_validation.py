@@ -0,0 +1,62 @@
+"""Tests for src.data.validation."""
+
+from src.data.ingestion import DataLoader
+from src.data.validation import DataValidator
+
+
+def test_validators_do_not_share_contracts():
+    first = DataValidator()
+    second = DataValidator()
+    
+    first.contracts["validation_thresholds"]["overall_quality_score"]["minimum"] = 0.0
+    
+    assert first.contracts is not second.contracts
+    assert second.contracts["validation_thresholds"]["overall_quality_score"]["minimum"] == 0.95
+    assert DataValidator().contracts["validation_thresholds"]["overall_quality_score"]["minimum"] == 0.95
+
+
+HEADER = "InvoiceNo,StockCode,Description,Quantity,InvoiceDate,UnitPrice,CustomerID,Country\n"
+
+ROWS = [
+    "536365,85123A,WHITE HANGING HEART T-LIGHT HOLDER,6,12/1/2010 8:26,2.55,17850,United Kingdom\n",
+    "536366,22633,HAND WARMER UNION JACK,6,12/1/2010 8:28,1.85,,United Kingdom\n",
+    "C536379,D,,1,12/1/2010 9:41,27.5,14527,United Kingdom\n",
+    "C536383,35004C,SET OF 3 COLOURED  FLYING DUCKS,-1,12/1/2010 9:49,4.65,15311,France\n",
+    "536367,84879,ASSORTED COLOUR BIRD ORNAMENT,20000,12/1/2010 8:34,1.69,13047,United Kingdom\n",
+    "536368,22960,JAM MAKING SET WITH JARS,6,12/1/2010 8:34,-4.25,,United Kingdom\n",
+    "536369,21756,BATH BUILDING BLOCK WORD,3,12/1/2010 8:35,5.95,13047,Germany\n",
+]
+
+
+def _stream_report(loader, filename, chunksize):
+    validator = DataValidator()
+    for chunk in loader.iter_chunks(filename, chunksize=chunksize):
+        validator.update(chunk)
+    return validator.generate_quality_report()
+
+
+def test_streamed_report_matches_full_report(tmp_path):
+    (tmp_path / "retail.csv").write_text(HEADER + "".join(ROWS), encoding="latin-1")
+    loader = DataLoader(data_dir=str(tmp_path))
+    
+    full = DataValidator().generate_quality_report(loader.load_retail_data("retail.csv"))
+    streamed = _stream_report(loader, "retail.csv", chunksize=2)
+    
+    assert streamed == full
+    assert full["completeness"]["CustomerID"]["missing_count"] == 2
+    assert full["value_ranges"]["Quantity"]["violations"] == 1
+    assert full["consistency"]["cancellation_quantity_match"]["violations"] == 1
+    assert full["consistency"]["positive_price"]["violations"] == 1
+
+
+def test_header_only_file_gives_empty_report(tmp_path):
+    (tmp_path / "retail.csv").write_text(HEADER, encoding="latin-1")
+    loader = DataLoader(data_dir=str(tmp_path))
+    
+    full = DataValidator().generate_quality_report(loader.load_retail_data("retail.csv"))
+    streamed = _stream_report(loader, "retail.csv", chunksize=2)
+    
+    assert streamed["overall_quality_score"] == full["overall_quality_score"]
+    assert streamed["completeness"]["InvoiceNo"]["missing_count"] == 0
+    assert not streamed["completeness"]["InvoiceNo"]["passes"]
+    assert streamed["consistency"]["positive_price"]["total_checked"] == 0